@@ -0,0 +1,244 @@
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+def normalize_text(text):
+    """Normalize text so trivially different inputs share a cache entry"""
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class AudioCache:
+    """Two-tier (memory LRU + disk) audio cache with Telegram file_id reuse
+
+    Disk entries are tracked in an in-memory LRU index, so eviction never
+    scans the directory. file_ids live in a bounded LRU that is persisted
+    to SQLite; hits are written along with the next new file_id.
+    """
+
+    def __init__(self, directory, max_memory_items=128, max_memory_bytes=64 * 1024 * 1024,
+                 max_memory_entry_bytes=2 * 1024 * 1024, max_disk_bytes=500 * 1024 * 1024,
+                 max_file_ids=100000):
+        self.directory = directory
+        self.max_memory_items = max_memory_items
+        self.max_memory_bytes = max_memory_bytes
+        # Long texts are only kept on disk so they cannot crowd out short phrases
+        self.max_memory_entry_bytes = max_memory_entry_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_file_ids = max_file_ids
+
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._file_ids = OrderedDict()
+        self._touched = {}
+        self._lock = threading.Lock()
+
+        self.hits = {'file_id': 0, 'memory': 0, 'disk': 0}
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.directory, 'file_ids.sqlite3'), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids "
+            "(key TEXT PRIMARY KEY, file_id TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._load_disk_index()
+        self._load_file_ids()
+
+    @staticmethod
+    def make_key(text, voice, audio_format):
+        """Build a content address from normalized text, voice and output format"""
+        raw = '\x00'.join((normalize_text(text), voice, audio_format))
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _audio_path(self, key):
+        return os.path.join(self.directory, f"{key}.audio")
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU index after a restart, oldest entries first"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.audio'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-6], stat.st_size))
+            elif entry.name.endswith('.fid'):
+                self._import_fid_file(entry)
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _import_fid_file(self, entry):
+        """Move a file_id stored by older versions (one .fid file per key) into SQLite"""
+        try:
+            with open(entry.path, 'r') as f:
+                file_id = f.read().strip()
+            with self._db:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO file_ids (key, file_id, last_used) VALUES (?, ?, ?)",
+                    (entry.name[:-4], file_id, entry.stat().st_mtime)
+                )
+            os.unlink(entry.path)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Failed to import cached file_id {entry.name}: {e}")
+
+    def _load_file_ids(self):
+        """Load the most recently used file_ids and drop the rest"""
+        with self._db:
+            self._db.execute(
+                "DELETE FROM file_ids WHERE key NOT IN "
+                "(SELECT key FROM file_ids ORDER BY last_used DESC LIMIT ?)",
+                (self.max_file_ids,)
+            )
+            rows = self._db.execute("SELECT key, file_id FROM file_ids ORDER BY last_used").fetchall()
+        self._file_ids.update(rows)
+
+    def get_file_id(self, key):
+        """Return the Telegram file_id for key, if this audio was uploaded before"""
+        with self._lock:
+            file_id = self._file_ids.get(key)
+            if file_id:
+                self._file_ids.move_to_end(key)
+                self._touched[key] = time.time()
+                self.hits['file_id'] += 1
+            return file_id
+
+    def set_file_id(self, key, file_id):
+        """Remember the Telegram file_id for key so later hits skip the upload"""
+        now = time.time()
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._file_ids.move_to_end(key)
+            evicted = []
+            while len(self._file_ids) > self.max_file_ids:
+                evicted.append((self._file_ids.popitem(last=False)[0],))
+            touched, self._touched = self._touched, {}
+            try:
+                with self._db:
+                    self._db.execute(
+                        "INSERT INTO file_ids (key, file_id, last_used) VALUES (?, ?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET file_id = excluded.file_id, "
+                        "last_used = excluded.last_used",
+                        (key, file_id, now)
+                    )
+                    self._db.executemany(
+                        "UPDATE file_ids SET last_used = ? WHERE key = ?",
+                        [(last_used, touched_key) for touched_key, last_used in touched.items()]
+                    )
+                    self._db.executemany("DELETE FROM file_ids WHERE key = ?", evicted)
+            except sqlite3.Error as e:
+                logging.error(f"Failed to store file_id: {e}")
+
+    def forget_file_id(self, key):
+        """Drop a file_id that Telegram no longer accepts"""
+        with self._lock:
+            self._file_ids.pop(key, None)
+            self._touched.pop(key, None)
+            try:
+                with self._db:
+                    self._db.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+            except sqlite3.Error as e:
+                logging.error(f"Failed to forget file_id: {e}")
+
+    def get(self, key):
+        """Return cached audio bytes for key from memory or disk, or None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits['memory'] += 1
+                return data
+            on_disk = key in self._disk
+            if on_disk:
+                self._disk.move_to_end(key)
+            else:
+                self.misses += 1
+        if not on_disk:
+            return None
+
+        path = self._audio_path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted while we were reading it
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits['disk'] += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store audio bytes in both tiers, evicting old disk entries if needed"""
+        with self._lock:
+            self._remember(key, data)
+            if key in self._disk:
+                return
+            # Reserve the entry so concurrent puts of the same key write once
+            self._disk[key] = len(data)
+            self._disk_bytes += len(data)
+            over_limit = self._disk_bytes > self.max_disk_bytes
+
+        path = self._audio_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            with self._lock:
+                if self._disk.pop(key, None) is not None:
+                    self._disk_bytes -= len(data)
+            raise
+        if over_limit:
+            self._evict_disk()
+
+    def _remember(self, key, data):
+        if len(data) > self.max_memory_entry_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while len(self._memory) > self.max_memory_items or self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        """Remove least recently used files until the disk tier fits its budget"""
+        while True:
+            with self._lock:
+                if self._disk_bytes <= self.max_disk_bytes or not self._disk:
+                    return
+                key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+            try:
+                os.unlink(self._audio_path(key))
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            return {
+                'hits': dict(self.hits),
+                'misses': self.misses,
+                'memory_items': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'file_ids': len(self._file_ids),
+            }
@@ -0,0 +1,159 @@
+import os
+import sqlite3
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from xml.etree import ElementTree
+
+from synthesis import iter_chunks
+
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+# .txt files are read in blocks of this many characters
+TXT_BLOCK_CHARS = 64 * 1024
+
+AudiobookJob = namedtuple(
+    'AudiobookJob',
+    'id chat_id user_id file_path file_name voice status_message_id next_part'
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audiobook_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    file_path TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    status_message_id INTEGER,
+    next_part INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'running',
+    created_at REAL NOT NULL
+);
+"""
+
+
+def iter_txt_paragraphs(path, block_chars=TXT_BLOCK_CHARS):
+    """Yield lines of a text file, reading it in blocks of block_chars
+
+    A line longer than a block (e.g. a file without line breaks) is cut at
+    the last space within the block, so memory does not grow with it.
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        pending = ''
+        while True:
+            block = f.read(block_chars)
+            lines = (pending + block).split('\n')
+            pending = lines.pop() if block else ''
+            while len(pending) >= block_chars:
+                cut = pending.rfind(' ', 0, block_chars)
+                if cut <= 0:
+                    cut = block_chars
+                lines.append(pending[:cut])
+                pending = pending[cut:]
+            for line in lines:
+                line = line.strip()
+                if line:
+                    yield line
+            if not block:
+                return
+
+
+def iter_docx_paragraphs(path):
+    """Yield paragraph texts of a .docx file, parsing document.xml incrementally"""
+    with zipfile.ZipFile(path) as archive, archive.open('word/document.xml') as document:
+        parents = []
+        for event, element in ElementTree.iterparse(document, events=('start', 'end')):
+            if event == 'start':
+                parents.append(element)
+                continue
+            parents.pop()
+
+            text = None
+            if element.tag == WORD_NS + 'p':
+                pieces = []
+                for node in element.iter():
+                    if node.tag == WORD_NS + 't' and node.text:
+                        pieces.append(node.text)
+                    elif node.tag in (WORD_NS + 'tab', WORD_NS + 'br'):
+                        pieces.append(' ')
+                text = ''.join(pieces).strip()
+                element.clear()
+            # Detach finished paragraphs and tables so the tree does not
+            # grow with the document
+            if parents and parents[-1].tag == WORD_NS + 'body':
+                parents[-1].remove(element)
+            if text:
+                yield text
+
+
+def iter_document(path):
+    if path.lower().endswith('.docx'):
+        return iter_docx_paragraphs(path)
+    return iter_txt_paragraphs(path)
+
+
+def iter_parts(paragraphs, part_chars):
+    """Group paragraphs into parts of at most part_chars characters
+
+    The split only depends on the document, so a resumed job can skip the
+    parts it has already delivered.
+    """
+    current = []
+    length = 0
+    for paragraph in paragraphs:
+        for piece in iter_chunks(paragraph, part_chars):
+            if current and length + 1 + len(piece) > part_chars:
+                yield '\n'.join(current)
+                current = []
+                length = 0
+            current.append(piece)
+            length += len(piece) + 1
+    if current:
+        yield '\n'.join(current)
+
+
+class AudiobookStore:
+    """SQLite checkpoints of document jobs, so a restart resumes them"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def create(self, chat_id, user_id, file_path, file_name, voice, status_message_id):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO audiobook_jobs "
+                "(chat_id, user_id, file_path, file_name, voice, status_message_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (chat_id, user_id, file_path, file_name, voice, status_message_id, time.time())
+            )
+        return AudiobookJob(
+            cursor.lastrowid, chat_id, user_id, file_path, file_name, voice, status_message_id, 0
+        )
+
+    def checkpoint(self, job_id, next_part):
+        """Record that every part before next_part has been delivered"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE audiobook_jobs SET next_part = ? WHERE id = ?", (next_part, job_id)
+            )
+
+    def finish(self, job_id, status='done'):
+        with self._lock:
+            self._db.execute(
+                "UPDATE audiobook_jobs SET status = ? WHERE id = ?", (status, job_id)
+            )
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, chat_id, user_id, file_path, file_name, voice, status_message_id, next_part "
+                "FROM audiobook_jobs WHERE status = 'running' ORDER BY id"
+            ).fetchall()
+        return [AudiobookJob(*row) for row in rows]
@@ -0,0 +1,133 @@
+import asyncio
+import itertools
+import time
+from collections import defaultdict, deque
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeTelegram:
+    """Minimal stand-in for the Telegram Bot API
+
+    Serves getUpdates from an in-memory list and accepts the outgoing calls
+    the bot makes. Every audio/voice reply (or error reply) is matched to
+    the oldest unanswered update of its chat to measure end-to-end latency.
+    """
+
+    def __init__(self):
+        self.updates = []
+        self.new_update = asyncio.Condition()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.file_ids = itertools.count(1)
+
+        self.pending = defaultdict(deque)
+        self.latencies = []
+        self.failures = defaultdict(int)
+        self.calls = defaultdict(int)
+        self.uploaded_bytes = 0
+
+    def create_app(self):
+        app = web.Application(client_max_size=100 * 1024 * 1024)
+        app.router.add_route('*', '/bot{token}/{method}', self.dispatch)
+        return app
+
+    async def push_text(self, user_id, text):
+        """Deliver a private text message from user_id to the bot"""
+        update = {
+            "update_id": next(self.update_ids),
+            "message": {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private", "first_name": f"User{user_id}"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+                "text": text,
+            },
+        }
+        self.pending[user_id].append(time.perf_counter())
+        async with self.new_update:
+            self.updates.append(update)
+            self.new_update.notify_all()
+
+    def unanswered(self):
+        return sum(len(queue) for queue in self.pending.values())
+
+    def _answer(self, chat_id, failure=None):
+        queue = self.pending.get(chat_id)
+        if not queue:
+            return
+        sent_at = queue.popleft()
+        if failure:
+            self.failures[failure] += 1
+        else:
+            self.latencies.append(time.perf_counter() - sent_at)
+
+    def _message(self, chat_id, **fields):
+        return {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            **fields,
+        }
+
+    async def dispatch(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        handler = getattr(self, f"api_{method}", None)
+        result = await handler(params) if handler else True
+        return web.json_response({"ok": True, "result": result})
+
+    async def api_getMe(self, params):
+        return BOT_USER
+
+    async def api_getUpdates(self, params):
+        offset = int(params.get('offset', 0) or 0)
+        timeout = float(params.get('timeout', 0) or 0)
+        async with self.new_update:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            if not self.updates and timeout:
+                try:
+                    await asyncio.wait_for(self.new_update.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self.updates[:100]
+
+    async def api_sendMessage(self, params):
+        chat_id = int(params['chat_id'])
+        text = params.get('text', '')
+        if text.startswith('⏳'):
+            self._answer(chat_id, failure='busy')
+        elif text.startswith('❌'):
+            self._answer(chat_id, failure='error')
+        return self._message(chat_id, text=text)
+
+    async def api_editMessageText(self, params):
+        chat_id = int(params['chat_id'])
+        text = params.get('text', '')
+        if text.startswith('❌'):
+            self._answer(chat_id, failure='error')
+        return self._message(chat_id, text=text)
+
+    async def _send_media(self, params, kind):
+        chat_id = int(params['chat_id'])
+        media = params[kind]
+        if isinstance(media, web.FileField):
+            self.uploaded_bytes += len(media.file.read())
+            file_id = f"{kind}-{next(self.file_ids)}"
+        else:
+            file_id = media
+        self._answer(chat_id)
+        return self._message(
+            chat_id,
+            **{kind: {"file_id": file_id, "file_unique_id": file_id, "duration": 1}}
+        )
+
+    async def api_sendAudio(self, params):
+        return await self._send_media(params, 'audio')
+
+    async def api_sendVoice(self, params):
+        return await self._send_media(params, 'voice')
@@ -0,0 +1,65 @@
+import asyncio
+import re
+import uuid
+
+from aiohttp import WSMsgType, web
+
+PROSODY = re.compile(r"<prosody[^>]*>(.*?)</prosody>", re.S)
+
+
+class FakeTTS:
+    """Stand-in for the edge-tts websocket service
+
+    Answers every SSML request with turn.start, MP3-sized binary audio
+    frames and turn.end, after a delay of base_delay + per_char_delay * len.
+    """
+
+    def __init__(self, base_delay=0.2, per_char_delay=0.0005, bytes_per_char=400, frame_size=4096):
+        self.base_delay = base_delay
+        self.per_char_delay = per_char_delay
+        self.bytes_per_char = bytes_per_char
+        self.frame_size = frame_size
+        self.requests = 0
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get('/edge/v1', self.websocket)
+        return app
+
+    @staticmethod
+    def _text_message(request_id, path, body="{}"):
+        return (
+            f"X-RequestId:{request_id}\r\n"
+            "Content-Type:application/json; charset=utf-8\r\n"
+            f"Path:{path}\r\n\r\n{body}"
+        )
+
+    @staticmethod
+    def _audio_message(request_id, data):
+        header = (
+            f"X-RequestId:{request_id}\r\n"
+            "Content-Type:audio/mpeg\r\n"
+            "Path:audio\r\n"
+        ).encode()
+        return len(header).to_bytes(2, "big") + header + data
+
+    async def websocket(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        async for message in ws:
+            if message.type != WSMsgType.TEXT or "Path:ssml" not in message.data:
+                continue
+            self.requests += 1
+            match = PROSODY.search(message.data)
+            length = len(match.group(1)) if match else 0
+            request_id = uuid.uuid4().hex
+
+            await asyncio.sleep(self.base_delay + self.per_char_delay * length)
+            await ws.send_str(self._text_message(request_id, "turn.start"))
+            remaining = max(self.bytes_per_char * length, self.frame_size)
+            frame = b"\xff\xf3" + b"\x00" * (self.frame_size - 2)
+            while remaining > 0:
+                await ws.send_bytes(self._audio_message(request_id, frame[:remaining]))
+                remaining -= self.frame_size
+            await ws.send_str(self._text_message(request_id, "turn.end"))
+        return ws
@@ -0,0 +1,247 @@
+"""Offline load test: python -m benchmarks.run [options]
+
+Starts a fake Bot API server and a fake edge-tts websocket service, points
+the bot at them, replays synthetic traffic and reports throughput,
+end-to-end latency percentiles and memory use. Results are written to
+benchmarks/results/ and compared with the previous run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+from aiohttp import web
+
+from benchmarks.fake_telegram import FakeTelegram
+from benchmarks.fake_tts import FakeTTS
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+WORDS = (
+    "salom dunyo bugun ertaga kitob maktab shahar uy oila do'st ish vaqt yil kun "
+    "yaxshi katta kichik yangi eski go'zal tez sekin ovoz matn xabar savol javob"
+).split()
+PHRASES = [
+    "Assalomu alaykum!",
+    "Xayrli tong, qalaysiz?",
+    "Rahmat, hammasi yaxshi.",
+    "Tug'ilgan kuningiz bilan tabriklayman!",
+    "Bugun havo juda yaxshi.",
+    "Yangi yil muborak bo'lsin!",
+]
+
+# Settings a deployment's .env could change, pinned so runs stay offline
+# and comparable (worker processes would not see the fake edge-tts URL)
+BOT_SETTINGS = {
+    'SYNTH_BACKEND': 'local',
+    'DEFAULT_OUTPUT_FORMAT': 'mp3',
+    'MAX_QUEUE_PER_USER': '5',
+    'MAX_PENDING_JOBS': '200',
+    'SYNTH_CONCURRENCY': '4',
+    'SYNTH_CHUNK_CHARS': '800',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=5, help="messages per user")
+    parser.add_argument('--think-time', type=float, default=0.5, help="mean pause between a user's messages (s)")
+    parser.add_argument('--repeat-ratio', type=float, default=0.3, help="share of messages taken from a few common phrases")
+    parser.add_argument('--tts-delay', type=float, default=0.2, help="fake edge-tts base delay per request (s)")
+    parser.add_argument('--tts-per-char', type=float, default=0.0005, help="fake edge-tts extra delay per character (s)")
+    parser.add_argument('--bytes-per-char', type=int, default=400, help="fake audio size per character")
+    parser.add_argument('--status-mode', choices=('message', 'chat_action'), default='message')
+    parser.add_argument('--max-concurrent', type=int, default=4, help="MAX_CONCURRENT_JOBS of the bot")
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='', help="free-form note saved with the results")
+    return parser.parse_args()
+
+
+def random_text(rng, repeat_ratio):
+    """Mix of repeated phrases and short, medium and long texts"""
+    if rng.random() < repeat_ratio:
+        return rng.choice(PHRASES)
+    roll = rng.random()
+    if roll < 0.6:
+        words = rng.randint(3, 30)
+    elif roll < 0.9:
+        words = rng.randint(30, 300)
+    else:
+        words = rng.randint(300, 1200)
+    sentences = []
+    while words > 0:
+        size = min(words, rng.randint(4, 14))
+        sentences.append(" ".join(rng.choice(WORDS) for _ in range(size)).capitalize() + ".")
+        words -= size
+    return " ".join(sentences)[:10000]
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def current_rss():
+    """Resident set size in bytes (Linux), or None"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+async def sample_memory(samples):
+    while True:
+        rss = current_rss()
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(0.1)
+
+
+async def start_server(app):
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+
+async def user_session(fake, user_id, args, rng):
+    for _ in range(args.messages):
+        await fake.push_text(user_id, random_text(rng, args.repeat_ratio))
+        await asyncio.sleep(rng.expovariate(1 / args.think_time) if args.think_time else 0)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    previous = sorted(f for f in os.listdir(RESULTS_DIR) if f.endswith('.json'))
+    path = os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {path}")
+
+    if previous:
+        with open(os.path.join(RESULTS_DIR, previous[-1])) as f:
+            before = json.load(f)
+        print(f"Compared with {previous[-1]} ({before.get('revision')}):")
+        for key in ('throughput', 'p50', 'p95', 'p99', 'peak_rss_mb'):
+            old, new = before.get(key), results.get(key)
+            if old is not None and new is not None:
+                print(f"  {key:12} {old:10.3f} -> {new:10.3f}")
+
+
+async def run(args):
+    fake_telegram = FakeTelegram()
+    fake_tts = FakeTTS(
+        base_delay=args.tts_delay,
+        per_char_delay=args.tts_per_char,
+        bytes_per_char=args.bytes_per_char
+    )
+    telegram_runner, telegram_port = await start_server(fake_telegram.create_app())
+    tts_runner, tts_port = await start_server(fake_tts.create_app())
+
+    # Configure the bot before it is imported
+    os.environ['BOT_TOKEN'] = '123456:BENCH'
+    os.environ['TELEGRAM_API_URL'] = f"http://127.0.0.1:{telegram_port}/bot"
+    # Keep every on-disk state away from a real deployment in this checkout
+    state_dir = tempfile.mkdtemp(prefix='tts-bench-')
+    os.environ['AUDIO_CACHE_DIR'] = os.path.join(state_dir, 'cache')
+    os.environ['AUDIOBOOK_DIR'] = os.path.join(state_dir, 'audiobooks')
+    os.environ['SETTINGS_DB_PATH'] = os.path.join(state_dir, 'settings.sqlite3')
+    os.environ['JOB_QUEUE_PATH'] = os.path.join(state_dir, 'jobs.sqlite3')
+    os.environ['NO_PROXY'] = '127.0.0.1,localhost'
+    os.environ.update(BOT_SETTINGS)
+    os.environ['STATUS_MODE'] = args.status_mode
+    os.environ['MAX_CONCURRENT_JOBS'] = str(args.max_concurrent)
+
+    import edge_tts.communicate
+    edge_tts.communicate.WSS_URL = f"ws://127.0.0.1:{tts_port}/edge/v1?TrustedClientToken=bench"
+
+    import bot
+
+    memory = []
+    sampler = asyncio.create_task(sample_memory(memory))
+    application = bot.build_application()
+    await bot.start_bot(application)
+
+    rng = random.Random(args.seed)
+    total = args.users * args.messages
+    print(f"Sending {total} messages from {args.users} users...")
+    started = time.perf_counter()
+    users = [
+        asyncio.create_task(user_session(fake_telegram, 1000 + n, args, random.Random(rng.random())))
+        for n in range(args.users)
+    ]
+    await asyncio.gather(*users)
+    deadline = started + args.timeout
+    while fake_telegram.unanswered() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    await bot.stop_bot(application)
+    sampler.cancel()
+    await telegram_runner.cleanup()
+    await tts_runner.cleanup()
+
+    latencies = fake_telegram.latencies
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'label': args.label,
+        'config': vars(args),
+        'bot_settings': BOT_SETTINGS,
+        'messages': total,
+        'answered': len(latencies),
+        'failures': dict(fake_telegram.failures),
+        'unanswered': fake_telegram.unanswered(),
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'peak_rss_mb': max(memory) / 2 ** 20 if memory else None,
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'tts_requests': fake_tts.requests,
+        'uploaded_bytes': fake_telegram.uploaded_bytes,
+        'api_calls': dict(fake_telegram.calls),
+        'cache': bot.audio_cache.stats(),
+    }
+
+    print(f"Answered {results['answered']}/{total} in {elapsed:.1f}s "
+          f"({results['throughput']:.2f} msg/s), failures: {results['failures']}")
+    if latencies:
+        print(f"Latency p50 {results['p50']:.3f}s  p95 {results['p95']:.3f}s  p99 {results['p99']:.3f}s")
+    print(f"Peak RSS {results['peak_rss_mb']} MB (includes the fake servers)")
+    print(f"edge-tts requests {results['tts_requests']}, uploaded {results['uploaded_bytes']} bytes")
+    save_results(results)
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,31 @@
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
-import edge_tts
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup,
+    InlineQueryResultCachedAudio, InlineQueryResultsButton
+)
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, TelegramError
+from telegram.request import HTTPXRequest
+from telegram.ext import (
+    Application, CommandHandler, MessageHandler, filters, ContextTypes,
+    CallbackQueryHandler, InlineQueryHandler
+)
 import asyncio
 import os
-import tempfile
+import signal
+import time
 from dotenv import load_dotenv
-import nest_asyncio
-
-# Enable nested event loops
-nest_asyncio.apply()
+from audio_cache import AudioCache
+from audiobook import AudiobookStore, iter_document, iter_parts
+from job_queue import JobQueue
+import metrics
+from metrics import instrumented, stage
+from rate_limiter import FloodLimiter
+from scheduler import SchedulerBusy, SynthesisScheduler
+from settings_store import SettingsStore, UserSettings
+from synth_worker import JOB_QUEUE_PATH, JOBS_PER_WORKER, SYNTH_CHUNK_CHARS, SYNTH_CONCURRENCY, WorkerPool
+from synthesis import synthesize
+from transcode import TranscodeError, opus_available, opus_settings, to_opus
 
 # Load environment variables
 load_dotenv()
@@ -19,6 +35,9 @@ TOKEN = os.getenv('BOT_TOKEN')
 if not TOKEN:
     raise ValueError("BOT_TOKEN not found in environment variables")
 
+# Bot API endpoint, e.g. http://localhost:8081/bot (default: api.telegram.org)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -32,7 +51,87 @@ VOICES = {
 }
 
 # Default voice
-current_voice = "uz-UZ-SardorNeural"
+DEFAULT_VOICE = "uz-UZ-SardorNeural"
+
+# edge-tts output format (part of the cache key)
+AUDIO_FORMAT = "audio-24khz-48kbitrate-mono-mp3"
+
+# Reply formats: MP3 track, or Ogg/Opus voice note (bitrate chosen by text length)
+OUTPUT_FORMATS = {
+    "🎵 Audio (MP3)": "mp3",
+    "🎤 Ovozli xabar": "voice",
+    "🎤 Ovozli xabar (yuqori sifat)": "voice_hq"
+}
+DEFAULT_OUTPUT_FORMAT = os.getenv('DEFAULT_OUTPUT_FORMAT', 'mp3')
+
+# Reverse maps for showing the current choice
+VOICE_NAMES = {voice: name for name, voice in VOICES.items()}
+FORMAT_NAMES = {output_format: name for name, output_format in OUTPUT_FORMATS.items()}
+
+# Per-user voice, output format and speech rate; cached in memory, saved in batches
+settings_store = SettingsStore(
+    os.getenv('SETTINGS_DB_PATH', 'data/settings.sqlite3'),
+    UserSettings(voice=DEFAULT_VOICE, output_format=DEFAULT_OUTPUT_FORMAT, rate="+0%"),
+    active_days=int(os.getenv('SETTINGS_ACTIVE_DAYS', '30'))
+)
+
+# Synthesized audio cache
+audio_cache = AudioCache(
+    os.getenv('AUDIO_CACHE_DIR', 'cache/audio'),
+    max_memory_items=int(os.getenv('AUDIO_CACHE_MEMORY_ITEMS', '128')),
+    max_memory_bytes=int(os.getenv('AUDIO_CACHE_MEMORY_MB', '64')) * 1024 * 1024,
+    max_disk_bytes=int(os.getenv('AUDIO_CACHE_DISK_MB', '500')) * 1024 * 1024,
+    max_file_ids=int(os.getenv('AUDIO_CACHE_FILE_IDS', '100000'))
+)
+
+# "local" synthesizes in this process, "queue" hands jobs to worker processes
+SYNTH_BACKEND = os.getenv('SYNTH_BACKEND', 'local')
+job_queue = None
+worker_pool = None
+# In-flight job cap; with worker processes it defaults to what they can run at once
+MAX_CONCURRENT_JOBS = 4
+if SYNTH_BACKEND == 'queue':
+    job_queue = JobQueue(JOB_QUEUE_PATH)
+    # SYNTH_WORKERS=0 relies on workers started separately
+    worker_pool = WorkerPool(int(os.getenv('SYNTH_WORKERS', str(os.cpu_count() or 1))))
+    MAX_CONCURRENT_JOBS = max(MAX_CONCURRENT_JOBS, worker_pool.size * JOBS_PER_WORKER)
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', str(MAX_CONCURRENT_JOBS)))
+
+# Synthesis jobs: global concurrency cap, per-user queues served round-robin
+scheduler = SynthesisScheduler(
+    max_concurrent=MAX_CONCURRENT_JOBS,
+    max_queue_per_user=int(os.getenv('MAX_QUEUE_PER_USER', '5')),
+    max_pending=int(os.getenv('MAX_PENDING_JOBS', '200'))
+)
+
+# Inline mode: wait for the user to stop typing, let Telegram cache answers
+INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', '0.8'))
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+# Chat (e.g. a private channel) where new inline audio is uploaded to get a file_id
+INLINE_STORAGE_CHAT_ID = os.getenv('INLINE_STORAGE_CHAT_ID')
+inline_tasks = {}
+
+# Documents (.txt/.docx) are read as a stream and sent as numbered parts
+AUDIOBOOK_DIR = os.getenv('AUDIOBOOK_DIR', 'data/audiobooks')
+AUDIOBOOK_PART_CHARS = int(os.getenv('AUDIOBOOK_PART_CHARS', '4000'))
+AUDIOBOOK_PART_ATTEMPTS = int(os.getenv('AUDIOBOOK_PART_ATTEMPTS', '5'))
+AUDIOBOOK_MAX_FILE_SIZE = 20 * 1024 * 1024  # Bot API download limit
+audiobook_store = AudiobookStore(os.path.join(AUDIOBOOK_DIR, 'jobs.sqlite3'))
+audiobook_tasks = set()
+
+# Progress indicator: "message" sends and deletes a status message,
+# "chat_action" shows "sending voice..." instead (two API calls fewer)
+STATUS_MODE = os.getenv('STATUS_MODE', 'message')
+
+# Connections for outgoing Bot API calls (shared by all concurrent handlers)
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '32'))
+
+# Metrics sampled on every /metrics scrape
+metrics.QUEUE_DEPTH.set_function(lambda: scheduler.pending)
+metrics.IN_FLIGHT.set_function(lambda: scheduler.in_flight)
+metrics.register_cache(audio_cache)
+if job_queue:
+    metrics.WORKER_QUEUE_DEPTH.set_function(job_queue.depth)
 
 def get_voice_keyboard():
     """Create voice selection keyboard"""
@@ -41,6 +140,14 @@ def get_voice_keyboard():
         keyboard.append([InlineKeyboardButton(voice_name, callback_data=voice_name)])
     return InlineKeyboardMarkup(keyboard)
 
+def get_format_keyboard():
+    """Create output format selection keyboard"""
+    keyboard = []
+    for format_name, output_format in OUTPUT_FORMATS.items():
+        keyboard.append([InlineKeyboardButton(format_name, callback_data=f"format:{output_format}")])
+    return InlineKeyboardMarkup(keyboard)
+
+@instrumented
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start command handler"""
     await update.message.reply_text(
@@ -50,22 +157,27 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "❓ Yordam olish uchun /help buyrug'ini yuboring."
     )
 
+@instrumented
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Help command handler"""
-    current_voice_name = [k for k, v in VOICES.items() if v == current_voice][0]
+    settings = await settings_store.get(update.effective_user.id)
     help_text = (
         "🤖 *Bot buyruqlari:*\n\n"
         "/start - Botni ishga tushirish\n"
         "/help - Yordam xabarini ko'rsatish\n"
-        "/voice - Ovozni o'zgartirish\n\n"
+        "/voice - Ovozni o'zgartirish\n"
+        "/format - Audio formatini tanlash\n\n"
         "💡 *Qo'shimcha ma'lumotlar:*\n\n"
         "1. Menga istalgan matningizni yuboring\n"
         "2. Men uni ovozli xabar qilib qaytaraman\n"
         "3. Audio fayl nomi yuborilgan matningizning birinchi 2 ta so'zidan hosil qilinadi\n"
-        f"4. Hozirgi tanlangan ovoz: {current_voice_name}"
+        "4. Uzun matnlarni .txt yoki .docx fayl qilib yuboring - men ularni qism-qism audio qilib beraman\n"
+        f"5. Hozirgi tanlangan ovoz: {VOICE_NAMES.get(settings.voice, settings.voice)}\n"
+        f"6. Hozirgi format: {FORMAT_NAMES.get(settings.output_format, settings.output_format)}"
     )
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
+@instrumented
 async def voice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Voice selection command handler"""
     keyboard = get_voice_keyboard()
@@ -74,82 +186,180 @@ async def voice_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=keyboard
     )
 
+@instrumented
+async def format_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Output format selection command handler"""
+    await update.message.reply_text(
+        "🎧 Audio formatini tanlang:",
+        reply_markup=get_format_keyboard()
+    )
+
+@instrumented
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle button callbacks"""
-    global current_voice
     query = update.callback_query
     selected = query.data
     
     if selected in VOICES:
-        current_voice = VOICES[selected]
+        await settings_store.update(update.effective_user.id, voice=VOICES[selected])
         await query.answer(f"Ovoz {selected} ga o'zgartirildi")
         await query.edit_message_text(
             f"✅ Ovoz {selected} ga o'zgartirildi.\n\nEndi menga matn yuboring."
         )
+    elif selected.startswith("format:"):
+        output_format = selected[len("format:"):]
+        format_name = FORMAT_NAMES.get(output_format)
+        if format_name:
+            await settings_store.update(update.effective_user.id, output_format=output_format)
+            await query.answer(f"Format {format_name} ga o'zgartirildi")
+            await query.edit_message_text(
+                f"✅ Format {format_name} ga o'zgartirildi.\n\nEndi menga matn yuboring."
+            )
+
+async def synthesize_audio(text, voice, cache_key):
+    """Synthesize text in a worker process or in memory, bypassing the cache"""
+    with stage('synthesis'):
+        if job_queue:
+            return await job_queue.run(cache_key, text, voice)
+        return await synthesize(
+            text,
+            voice,
+            max_concurrency=SYNTH_CONCURRENCY,
+            chunk_chars=SYNTH_CHUNK_CHARS
+        )
 
-async def text_to_speech(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Text to speech handler"""
+async def get_audio(text, voice, cache_key):
+    """Return audio bytes for text from the cache, synthesizing them on a miss"""
+    audio_data = await asyncio.to_thread(audio_cache.get, cache_key)
+    if audio_data is None:
+        audio_data = await synthesize_audio(text, voice, cache_key)
+        await asyncio.to_thread(audio_cache.put, cache_key, audio_data)
+    return audio_data
+
+async def keep_chat_action(bot, chat_id, action):
+    """Repeat a chat action until cancelled (Telegram shows it for ~5 seconds)"""
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=action)
+        except Exception as e:
+            logging.error(f"Failed to send chat action: {e}")
+        await asyncio.sleep(4)
+
+async def get_voice_note(text, voice, mp3_key, cache_key, bitrate, sample_rate):
+    """Return Ogg/Opus bytes for text, transcoding the (cached) MP3 on a miss"""
+    opus_data = await asyncio.to_thread(audio_cache.get, cache_key)
+    if opus_data is None:
+        mp3_data = await scheduler.shared(mp3_key, lambda: get_audio(text, voice, mp3_key))
+        with stage('transcode'):
+            opus_data = await to_opus(mp3_data, bitrate, sample_rate)
+        logging.info(
+            f"Voice note: {len(opus_data)} bytes Opus ({bitrate} kbit/s, {sample_rate} Hz) "
+            f"instead of {len(mp3_data)} bytes MP3"
+        )
+        await asyncio.to_thread(audio_cache.put, cache_key, opus_data)
+    return opus_data
+
+async def reply_with_audio(message, audio, title, as_voice):
+    """Send audio as a voice note or an MP3 track, returns the Telegram file_id"""
+    if as_voice:
+        sent = await message.reply_voice(
+            voice=audio,
+            caption="✅ Audio xabar tayyor!"
+        )
+        return sent.voice.file_id if sent.voice else None
+    sent = await message.reply_audio(
+        audio=audio,
+        filename=f"{title}.mp3",
+        title=title,
+        performer="TTS Bot",
+        caption="✅ Audio xabar tayyor!"
+    )
+    return sent.audio.file_id if sent.audio else None
+
+async def send_speech(update: Update, text, voice, output_format):
+    """Synthesize text and reply with the audio (runs inside the scheduler)"""
     status_message = None
-    audio_path = None
+    chat_action = None
     
     try:
-        text = update.message.text
-        if not text:
-            await update.message.reply_text("❌ Matn bo'sh bo'lishi mumkin emas!")
-            return
-        
-        if len(text) > 10000:
-            await update.message.reply_text("❌ Matn juda uzun! 1000 ta belgidan kam bo'lishi kerak.")
-            return
-            
         # Get first two words for audio title
         words = text.split()
         title = "_".join(words[:2]) if len(words) > 1 else words[0]
         title = f"audio_{title}"
         
-        # Send status message
-        status_message = await update.message.reply_text(
-            "🎵 Audio tayyorlanmoqda...\n"
-            "⏳ Biroz kuting..."
-        )
+        # Voice notes need ffmpeg, without it everyone gets MP3
+        mp3_key = AudioCache.make_key(text, voice, AUDIO_FORMAT)
+        as_voice = output_format != 'mp3' and opus_available()
+        if as_voice:
+            quality = 'high' if output_format == 'voice_hq' else 'auto'
+            bitrate, sample_rate = opus_settings(len(text), quality)
+            cache_key = AudioCache.make_key(text, voice, f"ogg-opus-{bitrate}k-{sample_rate}hz")
+        else:
+            cache_key = mp3_key
+        
+        # Reuse an already uploaded audio: no synthesis, no upload
+        file_id = audio_cache.get_file_id(cache_key)
+        if file_id:
+            try:
+                with stage('send_cached'):
+                    await reply_with_audio(update.message, file_id, title, as_voice)
+                return
+            except BadRequest as e:
+                logging.error(f"Cached file_id rejected: {e}")
+                audio_cache.forget_file_id(cache_key)
+        
+        # Show progress
+        if STATUS_MODE == 'chat_action':
+            chat_action = asyncio.create_task(
+                keep_chat_action(update.get_bot(), update.effective_chat.id, ChatAction.UPLOAD_VOICE)
+            )
+        else:
+            with stage('status_message'):
+                status_message = await update.message.reply_text(
+                    "🎵 Audio tayyorlanmoqda...\n"
+                    "⏳ Biroz kuting..."
+                )
         
         try:
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as temp_file:
-                audio_path = temp_file.name
-            
-            # Generate audio
-            communicate = edge_tts.Communicate(text, current_voice)
-            await communicate.save(audio_path)
-            
-            # Check if file exists and has content
-            if not os.path.exists(audio_path):
-                raise Exception("Audio fayl yaratilmadi!")
+            # Identical requests in flight share one synthesis
+            if as_voice:
+                try:
+                    audio_data = await scheduler.shared(
+                        cache_key,
+                        lambda: get_voice_note(text, voice, mp3_key, cache_key, bitrate, sample_rate)
+                    )
+                except TranscodeError as e:
+                    logging.error(f"Opus output unavailable, sending MP3: {e}")
+                    as_voice = False
+                    cache_key = mp3_key
+            if not as_voice:
+                audio_data = await scheduler.shared(
+                    mp3_key, lambda: get_audio(text, voice, mp3_key)
+                )
             
-            if os.path.getsize(audio_path) == 0:
-                raise Exception("Audio fayl bo'sh yaratildi!")
-                
             # Send audio with custom title
-            with open(audio_path, 'rb') as audio:
-                await update.message.reply_audio(
-                    audio=audio,
-                    title=title,
-                    performer="TTS Bot",
-                    caption="✅ Audio xabar tayyor!"
-                )
+            payload_format = 'opus' if as_voice else 'mp3'
+            metrics.PAYLOAD_BYTES.labels(payload_format).observe(len(audio_data))
+            upload_started = time.perf_counter()
+            with stage(f'upload_{payload_format}'):
+                file_id = await reply_with_audio(update.message, audio_data, title, as_voice)
+            logging.info(
+                f"Uploaded {len(audio_data)} bytes {payload_format} "
+                f"in {time.perf_counter() - upload_started:.2f}s"
+            )
         finally:
-            # Clean up temp file
-            if audio_path and os.path.exists(audio_path):
-                try:
-                    os.unlink(audio_path)
-                except Exception as e:
-                    logging.error(f"Failed to delete temp file: {e}")
+            if chat_action:
+                chat_action.cancel()
+        if file_id:
+            audio_cache.set_file_id(cache_key, file_id)
             
         # Delete status message
         if status_message:
-            await status_message.delete()
+            with stage('cleanup'):
+                await status_message.delete()
             
     except Exception as e:
+        metrics.ERRORS.labels(type(e).__name__).inc()
         error_text = f"❌ Xatolik yuz berdi: {str(e)}"
         if status_message:
             try:
@@ -162,6 +372,234 @@ async def text_to_speech(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Log the error
         logging.error(f"Error in text_to_speech: {str(e)}")
 
+@instrumented
+async def text_to_speech(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Text to speech handler"""
+    text = update.message.text
+    if not text:
+        await update.message.reply_text("❌ Matn bo'sh bo'lishi mumkin emas!")
+        return
+    
+    if len(text) > 10000:
+        await update.message.reply_text("❌ Matn juda uzun! 1000 ta belgidan kam bo'lishi kerak.")
+        return
+    
+    metrics.TEXT_LENGTH.labels(metrics.length_bucket(len(text))).inc()
+    
+    async def speak():
+        # Settings are read inside the job: a read that misses the cache must
+        # not let a later message of the same user get queued first
+        settings = await settings_store.get(update.effective_user.id)
+        metrics.VOICE_REQUESTS.labels(settings.voice).inc()
+        await send_speech(update, text, settings.voice, settings.output_format)
+    
+    try:
+        await scheduler.run(update.effective_user.id, speak)
+    except SchedulerBusy:
+        metrics.BUSY_REJECTIONS.inc()
+        await update.message.reply_text(
+            "⏳ Bot hozir band. Iltimos, birozdan so'ng qayta urinib ko'ring."
+        )
+
+async def upload_inline_audio(bot, text, voice, cache_key):
+    """Synthesize text and upload it to the storage chat to obtain a file_id"""
+    audio_data = await scheduler.shared(cache_key, lambda: get_audio(text, voice, cache_key))
+    words = text.split()
+    title = "audio_" + "_".join(words[:2])
+    with stage('upload_mp3'):
+        sent = await bot.send_audio(
+            chat_id=INLINE_STORAGE_CHAT_ID,
+            audio=audio_data,
+            filename=f"{title}.mp3",
+            title=title,
+            performer="TTS Bot"
+        )
+    file_id = sent.audio.file_id
+    audio_cache.set_file_id(cache_key, file_id)
+    return file_id
+
+async def answer_inline_query(query, bot, text, voice, cache_key):
+    """Debounce, then answer with cached or freshly synthesized audio"""
+    # A newer query from the same user cancels us while we wait here
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    try:
+        file_id = await scheduler.run(
+            query.from_user.id, lambda: upload_inline_audio(bot, text, voice, cache_key)
+        )
+    except SchedulerBusy:
+        metrics.BUSY_REJECTIONS.inc()
+        return
+    await query.answer(
+        [InlineQueryResultCachedAudio(id=cache_key[:64], audio_file_id=file_id)],
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=True
+    )
+
+@instrumented
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline query handler (@bot <text>)"""
+    query = update.inline_query
+    text = query.query.strip()
+    user_id = query.from_user.id
+    
+    # Every keystroke makes the previous query of this user stale
+    previous = inline_tasks.pop(user_id, None)
+    if previous:
+        previous.cancel()
+    if not text:
+        return
+    
+    voice = (await settings_store.get(user_id)).voice
+    cache_key = AudioCache.make_key(text, voice, AUDIO_FORMAT)
+    file_id = audio_cache.get_file_id(cache_key)
+    if file_id:
+        await query.answer(
+            [InlineQueryResultCachedAudio(id=cache_key[:64], audio_file_id=file_id)],
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=True
+        )
+        return
+    
+    if not INLINE_STORAGE_CHAT_ID:
+        # New audio can't be uploaded without a storage chat
+        await query.answer(
+            [],
+            cache_time=INLINE_CACHE_TIME,
+            is_personal=True,
+            button=InlineQueryResultsButton(text="🎙 Botda ovozga aylantirish", start_parameter="inline")
+        )
+        return
+    
+    task = asyncio.create_task(answer_inline_query(query, context.bot, text, voice, cache_key))
+    inline_tasks[user_id] = task
+    try:
+        await asyncio.wait([task])
+        if not task.cancelled() and task.exception():
+            logging.error(f"Error in inline_query: {task.exception()}")
+    finally:
+        if inline_tasks.get(user_id) is task:
+            del inline_tasks[user_id]
+
+async def deliver_audiobook_part(bot, job, index, text):
+    """Synthesize one part of a document and send it as a numbered track"""
+    # Book parts are not cached: they are large and rarely requested twice
+    cache_key = AudioCache.make_key(text, job.voice, AUDIO_FORMAT)
+    audio_data = await synthesize_audio(text, job.voice, cache_key)
+    title = f"{os.path.splitext(job.file_name)[0]} - {index + 1}-qism"
+    with stage('upload_mp3'):
+        await bot.send_audio(
+            chat_id=job.chat_id,
+            audio=audio_data,
+            filename=f"{title}.mp3",
+            title=title,
+            performer="TTS Bot"
+        )
+
+async def update_audiobook_progress(bot, job, text):
+    try:
+        await bot.edit_message_text(text, chat_id=job.chat_id, message_id=job.status_message_id)
+    except TelegramError as e:
+        logging.error(f"Failed to update audiobook progress: {e}")
+
+async def run_audiobook(bot, job):
+    """Deliver a document part by part, checkpointing after every part"""
+    parts_done = job.next_part
+    try:
+        parts = iter_parts(iter_document(job.file_path), AUDIOBOOK_PART_CHARS)
+        for index, text in enumerate(parts):
+            # Parts delivered before a restart
+            if index < job.next_part:
+                continue
+            
+            # Each part is a separate job, so other users are served in between
+            attempt = 0
+            while True:
+                try:
+                    await scheduler.run(
+                        job.user_id, lambda: deliver_audiobook_part(bot, job, index, text)
+                    )
+                    break
+                except SchedulerBusy:
+                    await asyncio.sleep(5)
+                except Exception as e:
+                    # Network and edge-tts errors are usually temporary
+                    attempt += 1
+                    if attempt >= AUDIOBOOK_PART_ATTEMPTS:
+                        raise
+                    metrics.ERRORS.labels(type(e).__name__).inc()
+                    logging.warning(f"Audiobook job {job.id} part {index + 1} failed, retrying: {e}")
+                    await asyncio.sleep(min(5 * 2 ** attempt, 300))
+            
+            parts_done = index + 1
+            await asyncio.to_thread(audiobook_store.checkpoint, job.id, parts_done)
+            await update_audiobook_progress(
+                bot, job, f"📖 {job.file_name}\n🎵 {parts_done}-qism yuborildi, davom etmoqda..."
+            )
+        
+        await asyncio.to_thread(audiobook_store.finish, job.id)
+        await update_audiobook_progress(
+            bot, job, f"✅ {job.file_name}: barcha {parts_done} ta qism yuborildi!"
+        )
+    except asyncio.CancelledError:
+        # Shutting down: the job resumes from its checkpoint on the next start
+        raise
+    except Exception as e:
+        metrics.ERRORS.labels(type(e).__name__).inc()
+        logging.error(f"Error in audiobook job {job.id}: {e}")
+        await asyncio.to_thread(audiobook_store.finish, job.id, 'failed')
+        await update_audiobook_progress(
+            bot, job, f"❌ {job.file_name}: {parts_done}-qismdan keyin xatolik yuz berdi: {e}"
+        )
+    
+    try:
+        os.unlink(job.file_path)
+    except OSError as e:
+        logging.error(f"Failed to delete document: {e}")
+
+def start_audiobook(bot, job):
+    """Run a document job in the background (it can take hours)"""
+    task = asyncio.create_task(run_audiobook(bot, job))
+    audiobook_tasks.add(task)
+    task.add_done_callback(audiobook_tasks.discard)
+
+@instrumented
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Turn a .txt or .docx document into numbered audio parts"""
+    document = update.message.document
+    if document.file_size and document.file_size > AUDIOBOOK_MAX_FILE_SIZE:
+        await update.message.reply_text("❌ Fayl juda katta! 20 MB dan kichik bo'lishi kerak.")
+        return
+    
+    file_name = document.file_name or "kitob.txt"
+    status_message = await update.message.reply_text(
+        f"📖 {file_name} qabul qilindi.\n⏳ Audio qismlar tayyorlanmoqda..."
+    )
+    
+    try:
+        extension = os.path.splitext(file_name)[1].lower()
+        file_path = os.path.join(
+            AUDIOBOOK_DIR, f"{update.effective_chat.id}_{update.message.message_id}{extension}"
+        )
+        telegram_file = await context.bot.get_file(document.file_id)
+        await telegram_file.download_to_drive(file_path)
+    except Exception as e:
+        metrics.ERRORS.labels(type(e).__name__).inc()
+        await status_message.edit_text(f"❌ Faylni yuklab bo'lmadi: {e}")
+        return
+    
+    settings = await settings_store.get(update.effective_user.id)
+    job = await asyncio.to_thread(
+        audiobook_store.create,
+        update.effective_chat.id,
+        update.effective_user.id,
+        file_path,
+        file_name,
+        settings.voice,
+        status_message.message_id
+    )
+    start_audiobook(context.bot, job)
+
+@instrumented
 async def handle_invalid_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle non-text messages"""
     message_type = "nomalum"
@@ -174,7 +612,7 @@ async def handle_invalid_message(update: Update, context: ContextTypes.DEFAULT_T
     elif update.message.voice:
         message_type = "ovozli xabar"
     elif update.message.document:
-        message_type = "fayl"
+        message_type = "bu turdagi fayl (faqat .txt va .docx)"
     elif update.message.sticker:
         message_type = "sticker"
     elif update.message.animation:
@@ -200,33 +638,45 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     except:
         pass
 
-async def main():
-    """Main function"""
-    # Configure logging
-    logging.basicConfig(
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        level=logging.INFO
-    )
-    
+def build_application():
+    """Create the application and register all handlers"""
     # Create application with all necessary parameters
-    application = (
+    request = HTTPXRequest(
+        connection_pool_size=TELEGRAM_POOL_SIZE,
+        connect_timeout=30,
+        read_timeout=30,
+        write_timeout=30,
+        pool_timeout=30
+    )
+    builder = (
         Application.builder()
         .token(TOKEN)
-        .connect_timeout(30)
-        .read_timeout(30)
-        .write_timeout(30)
-        .build()
+        .request(request)
+        .rate_limiter(FloodLimiter())
+        .concurrent_updates(True)
     )
+    if TELEGRAM_API_URL:
+        # Self-hosted Bot API server (or the benchmark's fake one)
+        builder = builder.base_url(TELEGRAM_API_URL)
+    application = builder.build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
     application.add_handler(CommandHandler("voice", voice_command))
+    application.add_handler(CommandHandler("format", format_command))
     application.add_handler(CallbackQueryHandler(button_callback))
+    application.add_handler(InlineQueryHandler(inline_query))
     
     # Handle text messages
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, text_to_speech))
     
+    # Handle text documents
+    application.add_handler(MessageHandler(
+        filters.Document.FileExtension("txt") | filters.Document.FileExtension("docx"),
+        handle_document
+    ))
+    
     # Handle non-text messages
     non_text_filter = (
         filters.PHOTO |  # For photos
@@ -242,33 +692,95 @@ async def main():
     
     # Add error handler
     application.add_error_handler(error_handler)
+    return application
+
+async def start_bot(application, webhook_url=None, webhook_secret=None):
+    """Start the application and receive updates via webhook or long polling"""
+    await application.initialize()
+    # Before start(): a webhook update must not race the warm-up
+    await asyncio.to_thread(settings_store.load_active)
+    await application.start()
+    settings_store.start()
+    scheduler.start()
+    if worker_pool:
+        await asyncio.to_thread(job_queue.purge, 3600)
+        worker_pool.start()
+    
+    # Resume document jobs interrupted by the last shutdown
+    for job in await asyncio.to_thread(audiobook_store.unfinished):
+        start_audiobook(application.bot, job)
+    
+    if webhook_url:
+        # Telegram pushes updates to our HTTP server
+        await application.bot.set_webhook(
+            url=webhook_url,
+            secret_token=webhook_secret,
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True
+        )
+    else:
+        # Long polling: getUpdates blocks server-side until an update arrives
+        await application.bot.delete_webhook()
+        await application.updater.start_polling(
+            allowed_updates=Update.ALL_TYPES,
+            drop_pending_updates=True,
+            poll_interval=0,
+            timeout=30
+        )
+
+async def stop_bot(application):
+    """Stop receiving updates and shut the application down"""
+    if application.updater.running:
+        await application.updater.stop()
+    for task in list(audiobook_tasks):
+        task.cancel()
+    await asyncio.gather(*audiobook_tasks, return_exceptions=True)
+    await scheduler.stop()
+    await settings_store.stop()
+    if worker_pool:
+        await worker_pool.stop()
+    if application.running:
+        await application.stop()
+    await application.shutdown()
+
+async def wait_for_stop_signal():
+    """Block until SIGINT or SIGTERM is received"""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: KeyboardInterrupt still stops asyncio.run()
+            pass
+    await stop_event.wait()
+
+async def main():
+    """Main function (long polling only, see web_app.py for webhook mode)"""
+    # Configure logging
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    
+    application = build_application()
 
     # Start bot
     print("Bot ishga tushirilmoqda...")
     
     try:
-        await application.initialize()
-        await application.start()
+        await start_bot(application)
         print("Bot muvaffaqiyatli ishga tushdi!")
         
         # Run the bot until a stop signal is received
-        await application.updater.start_polling(
-            allowed_updates=Update.ALL_TYPES,
-            drop_pending_updates=True,
-            poll_interval=1.0
-        )
-        
-        # Keep the bot running
-        while True:
-            await asyncio.sleep(1)
+        await wait_for_stop_signal()
             
     except Exception as e:
         print(f"Bot ishga tushishda xatolik: {e}")
     finally:
         try:
             print("Bot to'xtatilmoqda...")
-            if application.running:
-                await application.stop()
+            await stop_bot(application)
             print("Bot to'xtatildi")
         except Exception as e:
             print(f"Botni to'xtatishda xatolik: {e}")
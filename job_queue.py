@@ -0,0 +1,179 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cache_key TEXT NOT NULL,
+    text TEXT NOT NULL,
+    voice TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker_id TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    audio BLOB,
+    error TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+class JobFailed(Exception):
+    """Raised when a job has failed on every attempt"""
+
+
+class JobQueue:
+    """SQLite-backed synthesis job queue shared by the bot and worker processes
+
+    A worker claims a job by taking a lease on it and keeps extending the
+    lease while it works. If the worker dies the lease runs out and the job
+    is handed to another worker, up to max_attempts times.
+    """
+
+    def __init__(self, path, lease_seconds=30, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._next_sweep = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def submit(self, cache_key, text, voice):
+        """Add a job and return its id
+
+        Every caller gets a row of its own, since the caller deletes it once
+        it has the result. Identical requests in the bot are already merged
+        by SynthesisScheduler.shared.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO jobs (cache_key, text, voice, created_at) VALUES (?, ?, ?, ?)",
+                (cache_key, text, voice, time.time())
+            )
+            return cursor.lastrowid
+
+    def claim(self, worker_id):
+        """Lease the oldest available job to worker_id, returns (id, text, voice) or None"""
+        now = time.time()
+        with self._lock:
+            if now >= self._next_sweep:
+                self._next_sweep = now + self.lease_seconds
+                # Jobs of crashed workers that ran out of attempts
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Worker crashed' "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, self.max_attempts)
+                )
+            # Idle workers only read, the write lock is taken when there is a job
+            if self._next_job(now) is None:
+                return None
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._next_job(now)
+                if row:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (worker_id, now + self.lease_seconds, row[0])
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return row
+
+    def _next_job(self, now):
+        return self._db.execute(
+            "SELECT id, text, voice FROM jobs "
+            "WHERE status = 'pending' OR (status = 'running' AND lease_until < ? AND attempts < ?) "
+            "ORDER BY id LIMIT 1",
+            (now, self.max_attempts)
+        ).fetchone()
+
+    def heartbeat(self, job_id, worker_id):
+        """Extend the lease, returns False if the job was taken away from this worker"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id, worker_id, audio):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'done', audio = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (audio, job_id, worker_id)
+            )
+
+    def fail(self, job_id, worker_id, error):
+        """Give the job back for a retry, or mark it failed after max_attempts"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, worker_id = NULL, lease_until = NULL "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (self.max_attempts, error, job_id, worker_id)
+            )
+
+    def result(self, job_id):
+        """Return (status, audio, error) for a job"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, audio, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return row if row else ('failed', None, 'Job not found')
+
+    def delete(self, job_id):
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def depth(self):
+        """Return the number of unfinished jobs"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('pending', 'running')"
+            ).fetchone()[0]
+
+    def purge(self, older_than):
+        """Delete finished jobs nobody collected (e.g. after a bot restart)"""
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND created_at < ?",
+                (time.time() - older_than,)
+            )
+
+    async def run(self, cache_key, text, voice, poll_interval=0.1):
+        """Submit a job and wait until a worker has synthesized it
+
+        A cancelled caller deletes its job so the audio is not left behind.
+        """
+        submitted = asyncio.ensure_future(asyncio.to_thread(self.submit, cache_key, text, voice))
+        try:
+            job_id = await asyncio.shield(submitted)
+            while True:
+                status, audio, error = await asyncio.to_thread(self.result, job_id)
+                if status == 'done':
+                    await asyncio.to_thread(self.delete, job_id)
+                    return audio
+                if status == 'failed':
+                    await asyncio.to_thread(self.delete, job_id)
+                    raise JobFailed(error)
+                await asyncio.sleep(poll_interval)
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self.delete, await submitted)
+            raise
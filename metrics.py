@@ -0,0 +1,96 @@
+import functools
+import time
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+HANDLER_LATENCY = Histogram(
+    'tts_handler_seconds', 'Time spent in each update handler',
+    ['handler'], buckets=LATENCY_BUCKETS
+)
+STAGE_LATENCY = Histogram(
+    'tts_stage_seconds', 'Time spent in each stage of a text-to-speech request',
+    ['stage'], buckets=LATENCY_BUCKETS
+)
+TEXT_LENGTH = Counter(
+    'tts_requests_by_length_total', 'Text-to-speech requests by text length bucket',
+    ['length']
+)
+VOICE_REQUESTS = Counter(
+    'tts_requests_by_voice_total', 'Text-to-speech requests by voice',
+    ['voice']
+)
+ERRORS = Counter(
+    'tts_errors_total', 'Errors by exception type',
+    ['type']
+)
+PAYLOAD_BYTES = Histogram(
+    'tts_payload_bytes', 'Size of uploaded audio by format',
+    ['format'], buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 50e6)
+)
+BUSY_REJECTIONS = Counter(
+    'tts_busy_rejections_total', 'Requests rejected because the queue was full'
+)
+QUEUE_DEPTH = Gauge(
+    'tts_queue_depth', 'Synthesis jobs waiting in the scheduler queues'
+)
+IN_FLIGHT = Gauge(
+    'tts_in_flight_jobs', 'Synthesis jobs currently running'
+)
+WORKER_QUEUE_DEPTH = Gauge(
+    'tts_worker_queue_depth', 'Unfinished jobs in the worker job queue'
+)
+
+LENGTH_BUCKETS = (100, 500, 1000, 2500, 5000, 10000)
+
+
+def length_bucket(length):
+    """Return the label of the text length bucket length falls into"""
+    for limit in LENGTH_BUCKETS:
+        if length <= limit:
+            return f"le_{limit}"
+    return "gt_10000"
+
+
+def stage(name):
+    """Context manager recording the latency of one request stage"""
+    return STAGE_LATENCY.labels(name).time()
+
+
+def instrumented(handler):
+    """Record latency and errors of an update handler"""
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await handler(update, context)
+        except Exception as e:
+            ERRORS.labels(type(e).__name__).inc()
+            raise
+        finally:
+            HANDLER_LATENCY.labels(handler.__name__).observe(time.perf_counter() - start)
+    return wrapper
+
+
+class AudioCacheCollector:
+    """Expose AudioCache hit/miss counters"""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.stats()
+        hits = CounterMetricFamily('tts_cache_hits', 'Audio cache hits by tier', labels=['tier'])
+        for tier, count in stats['hits'].items():
+            hits.add_metric([tier], count)
+        yield hits
+        yield CounterMetricFamily('tts_cache_misses', 'Audio cache misses', value=stats['misses'])
+        yield GaugeMetricFamily('tts_cache_disk_bytes', 'Audio cache size on disk', value=stats['disk_bytes'])
+        yield GaugeMetricFamily('tts_cache_memory_items', 'Audio cache entries in memory', value=stats['memory_items'])
+        yield GaugeMetricFamily('tts_cache_memory_bytes', 'Audio cache size in memory', value=stats['memory_bytes'])
+
+
+def register_cache(cache):
+    REGISTRY.register(AudioCacheCollector(cache))
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+
+class TokenBucket:
+    """Token bucket; callers that find it empty wait in line for the next token"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def is_idle(self):
+        """True when the bucket is full and nobody is waiting on it"""
+        self._refill()
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+
+class FloodLimiter(BaseRateLimiter):
+    """Keeps outgoing Bot API calls under Telegram's flood limits
+
+    Every call that targets a chat takes a token from the global bucket,
+    and sends also take one from that chat's bucket (group chats get a
+    slower one). Calls over the limit wait instead of failing. A 429
+    response pauses all calls for retry_after seconds, then the call is
+    retried.
+    """
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3, group_rate=20 / 60, max_retries=5):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}
+        self._not_paused = asyncio.Event()
+        self._not_paused.set()
+        self._paused_until = 0
+        self._pausers = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id):
+        if len(self._chats) > 1024:
+            for key, bucket in list(self._chats.items()):
+                if key != chat_id and bucket.is_idle():
+                    del self._chats[key]
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            rate = self.group_rate if chat_id < 0 else self.chat_rate
+            bucket = self._chats[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get('chat_id')
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            # Channel usernames are rare here, treat them as a group chat
+            chat_id = -1 if chat_id is not None else None
+        # Chat actions and deletes don't count against the per-chat message limit
+        per_chat = chat_id is not None and endpoint.startswith('send') and endpoint != 'sendChatAction'
+        max_retries = rate_limit_args or self.max_retries
+
+        for attempt in range(max_retries + 1):
+            await self._not_paused.wait()
+            if per_chat:
+                await self._chat_bucket(chat_id).acquire()
+            if chat_id is not None:
+                await self._global.acquire()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                logging.warning(f"Flood limit hit on {endpoint}, retrying after {e.retry_after}s")
+                await self._pause(e.retry_after + 0.1)
+
+    async def _pause(self, seconds):
+        """Hold all calls until the latest retry_after deadline has passed"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._not_paused.clear()
+        self._pausers += 1
+        try:
+            while (remaining := self._paused_until - time.monotonic()) > 0:
+                await asyncio.sleep(remaining)
+        finally:
+            self._pausers -= 1
+            # The last sleeper lifts the pause even if it was cancelled early
+            if self._pausers == 0 or time.monotonic() >= self._paused_until:
+                self._not_paused.set()
@@ -0,0 +1,126 @@
+import asyncio
+from collections import deque
+
+
+class SchedulerBusy(Exception):
+    """Raised when there is no room left in the synthesis queue"""
+
+
+class SynthesisScheduler:
+    """Fair scheduler for synthesis jobs
+
+    A fixed number of workers caps how many jobs run at once. Every user
+    has their own FIFO queue and at most one running job, so messages in a
+    chat are answered in order, and users with pending work are served
+    round-robin so one heavy user cannot starve the others.
+    """
+
+    def __init__(self, max_concurrent=4, max_queue_per_user=5, max_pending=200):
+        self.max_concurrent = max_concurrent
+        self.max_queue_per_user = max_queue_per_user
+        self.max_pending = max_pending
+
+        self._queues = {}
+        self._ready = asyncio.Queue()
+        self._workers = []
+        self._shared = {}
+        self.pending = 0
+        self.in_flight = 0
+
+    def start(self):
+        """Start the worker tasks (must be called from the running event loop)"""
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.max_concurrent)
+            ]
+
+    async def stop(self):
+        """Cancel the workers and every job still waiting in the queues"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for queue in self._queues.values():
+            for _, future in queue:
+                future.cancel()
+        self._queues.clear()
+        self.pending = 0
+
+    async def run(self, user_id, job):
+        """Queue job() for user_id and wait for its result
+
+        Raises SchedulerBusy instead of queueing when the user's queue or
+        the whole scheduler is full.
+        """
+        queue = self._queues.get(user_id)
+        if self.pending >= self.max_pending or (queue and len(queue) >= self.max_queue_per_user):
+            raise SchedulerBusy()
+
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user_id] = deque()
+            self._ready.put_nowait(user_id)
+        queue.append((job, future))
+        self.pending += 1
+        return await future
+
+    async def shared(self, key, factory):
+        """Run factory() once for every concurrent caller with the same key
+
+        The underlying task is cancelled only when all of its callers are.
+        """
+        entry = self._shared.get(key)
+        if entry is None:
+            entry = [asyncio.ensure_future(factory()), 0]
+            self._shared[key] = entry
+            entry[0].add_done_callback(lambda _: self._forget_shared(key, entry))
+        entry[1] += 1
+        try:
+            return await asyncio.shield(entry[0])
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not entry[0].done():
+                # A new caller must start a fresh task, not join the cancelled one
+                self._forget_shared(key, entry)
+                entry[0].cancel()
+
+    def _forget_shared(self, key, entry):
+        if self._shared.get(key) is entry:
+            del self._shared[key]
+
+    async def _worker(self):
+        while True:
+            user_id = await self._ready.get()
+            queue = self._queues[user_id]
+            job, future = queue.popleft()
+            self.pending -= 1
+
+            if not future.cancelled():
+                await self._run_job(job, future)
+
+            # Go to the back of the line if there is more work for this user
+            if queue:
+                self._ready.put_nowait(user_id)
+            else:
+                del self._queues[user_id]
+
+    async def _run_job(self, job, future):
+        self.in_flight += 1
+        task = asyncio.ensure_future(job())
+        future.add_done_callback(lambda f: task.cancel() if f.cancelled() else None)
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            task.cancel()
+            future.cancel()
+            raise
+        finally:
+            self.in_flight -= 1
+
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            if not future.done():
+                future.set_exception(task.exception())
+        elif not future.done():
+            future.set_result(task.result())
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+UserSettings = namedtuple('UserSettings', 'voice output_format rate')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_settings (
+    user_id INTEGER PRIMARY KEY,
+    voice TEXT NOT NULL,
+    output_format TEXT NOT NULL,
+    rate TEXT NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_settings_last_seen ON user_settings (last_seen);
+"""
+
+
+class SettingsStore:
+    """Per-user settings served from memory and written to SQLite in batches
+
+    Reads never wait for the database once a user is cached; a cache miss
+    is read in a thread on a separate connection. Changes and last-seen
+    times are collected in memory and flushed every flush_interval seconds
+    in one transaction. Only users seen in the last active_days days are
+    kept in memory; others are read again on their next use.
+    """
+
+    def __init__(self, path, defaults, active_days=30, flush_interval=5):
+        self.defaults = defaults
+        self.active_days = active_days
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # WAL lets reads go on while the write-behind thread holds a transaction
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+
+        self._cache = {}
+        self._used = OrderedDict()
+        self._stored = set()
+        self._dirty = set()
+        self._seen = {}
+        self._flusher = None
+
+    def load_active(self):
+        """Warm the cache with recently active users (call before handling updates)"""
+        since = time.time() - self.active_days * 86400
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT user_id, voice, output_format, rate, last_seen FROM user_settings "
+                "WHERE last_seen >= ? ORDER BY last_seen",
+                (since,)
+            ).fetchall()
+        for user_id, voice, output_format, rate, last_seen in rows:
+            # Never replace a change made since the bot started
+            if user_id in self._cache:
+                continue
+            self._cache[user_id] = UserSettings(voice, output_format, rate)
+            self._used[user_id] = last_seen
+            self._stored.add(user_id)
+        logging.info(f"Loaded settings of {len(rows)} active users")
+
+    def _read(self, user_id):
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT voice, output_format, rate FROM user_settings WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+
+    async def get(self, user_id):
+        """Return the settings of user_id (defaults for unknown users)"""
+        now = time.time()
+        self._seen[user_id] = now
+        self._used[user_id] = now
+        self._used.move_to_end(user_id)
+        settings = self._cache.get(user_id)
+        if settings is None:
+            row = await asyncio.to_thread(self._read, user_id)
+            if row:
+                settings = UserSettings(*row)
+                self._stored.add(user_id)
+            else:
+                settings = self.defaults
+            # An update may have landed while the row was being read
+            settings = self._cache.setdefault(user_id, settings)
+        return settings
+
+    async def update(self, user_id, **changes):
+        """Change some settings of user_id; persisted on the next flush"""
+        settings = (await self.get(user_id))._replace(**changes)
+        self._cache[user_id] = settings
+        self._dirty.add(user_id)
+        return settings
+
+    def _evict_cold(self):
+        """Forget users not seen for active_days (called on the event loop thread)"""
+        cutoff = time.time() - self.active_days * 86400
+        while self._used:
+            user_id, last_used = next(iter(self._used.items()))
+            if last_used >= cutoff:
+                break
+            del self._used[user_id]
+            if user_id not in self._dirty:
+                self._cache.pop(user_id, None)
+                self._stored.discard(user_id)
+
+    def _take_batch(self):
+        """Collect pending changes (called on the event loop thread)"""
+        dirty, self._dirty = self._dirty, set()
+        seen, self._seen = self._seen, {}
+        now = time.time()
+
+        upserts = []
+        for user_id in dirty:
+            upserts.append((user_id, *self._cache[user_id], seen.pop(user_id, now)))
+        touches = [(last_seen, user_id) for user_id, last_seen in seen.items() if user_id in self._stored]
+        return dirty, upserts, touches
+
+    def _write(self, upserts, touches):
+        """Write one batch in a single transaction"""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO user_settings (user_id, voice, output_format, rate, last_seen) "
+                    "VALUES (?, ?, ?, ?, ?) ON CONFLICT (user_id) DO UPDATE SET "
+                    "voice = excluded.voice, output_format = excluded.output_format, "
+                    "rate = excluded.rate, last_seen = excluded.last_seen",
+                    upserts
+                )
+                self._db.executemany(
+                    "UPDATE user_settings SET last_seen = ? WHERE user_id = ?", touches
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    async def flush(self):
+        """Write changed settings and last-seen times in the background"""
+        dirty, upserts, touches = self._take_batch()
+        if not upserts and not touches:
+            self._evict_cold()
+            return
+        try:
+            await asyncio.to_thread(self._write, upserts, touches)
+        except Exception:
+            # Keep the changes for the next attempt
+            self._dirty |= dirty
+            raise
+        self._stored.update(dirty)
+        self._evict_cold()
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error as e:
+                logging.error(f"Failed to save user settings: {e}")
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        """Stop the background writer and flush what is left"""
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+
+from dotenv import load_dotenv
+
+from job_queue import JobQueue
+from synthesis import synthesize
+
+load_dotenv()
+
+JOB_QUEUE_PATH = os.getenv('JOB_QUEUE_PATH', 'data/jobs.sqlite3')
+JOBS_PER_WORKER = int(os.getenv('JOBS_PER_WORKER', '2'))
+# Long texts are split into chunks that are synthesized in parallel
+SYNTH_CONCURRENCY = int(os.getenv('SYNTH_CONCURRENCY', '4'))
+SYNTH_CHUNK_CHARS = int(os.getenv('SYNTH_CHUNK_CHARS', '800'))
+
+
+async def keep_lease(queue, job_id, worker_id):
+    """Extend the job lease while the job is being synthesized"""
+    while True:
+        await asyncio.sleep(queue.lease_seconds / 3)
+        if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id):
+            logging.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+            return
+
+
+async def work(queue, worker_id, poll_interval=0.2):
+    """Claim and synthesize jobs until cancelled"""
+    while True:
+        job = await asyncio.to_thread(queue.claim, worker_id)
+        if job is None:
+            await asyncio.sleep(poll_interval)
+            continue
+
+        job_id, text, voice = job
+        lease = asyncio.create_task(keep_lease(queue, job_id, worker_id))
+        try:
+            audio_data = await synthesize(
+                text,
+                voice,
+                max_concurrency=SYNTH_CONCURRENCY,
+                chunk_chars=SYNTH_CHUNK_CHARS
+            )
+        except Exception as e:
+            logging.error(f"Job {job_id} failed on {worker_id}: {e}")
+            await asyncio.to_thread(queue.fail, job_id, worker_id, str(e))
+        else:
+            await asyncio.to_thread(queue.complete, job_id, worker_id, audio_data)
+        finally:
+            lease.cancel()
+
+
+async def run_worker():
+    """Run JOBS_PER_WORKER job loops in this process"""
+    queue = JobQueue(JOB_QUEUE_PATH)
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    logging.info(f"Synthesis worker {prefix} started")
+    try:
+        await asyncio.gather(*(work(queue, f"{prefix}-{n}") for n in range(JOBS_PER_WORKER)))
+    finally:
+        queue.close()
+
+
+class WorkerPool:
+    """Keeps a number of local synthesis worker processes alive
+
+    Workers started by hand with `python synth_worker.py` use the same job
+    queue, so more workers can join (or leave) at any time.
+    """
+
+    def __init__(self, size, check_interval=5):
+        self.size = size
+        self.check_interval = check_interval
+        self._processes = []
+        self._monitor = None
+
+    def _spawn(self):
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            env={**os.environ, 'JOB_QUEUE_PATH': JOB_QUEUE_PATH}
+        )
+
+    def ensure_running(self):
+        """Replace workers that have exited"""
+        for index, process in enumerate(self._processes):
+            if process.poll() is not None:
+                logging.error(f"Synthesis worker {process.pid} exited with {process.returncode}, restarting")
+                self._processes[index] = self._spawn()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            self.ensure_running()
+
+    def start(self):
+        self._processes = [self._spawn() for _ in range(self.size)]
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._monitor:
+            self._monitor.cancel()
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            await asyncio.to_thread(process.wait)
+        self._processes = []
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+    try:
+        asyncio.run(run_worker())
+    except KeyboardInterrupt:
+        pass
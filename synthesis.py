@@ -0,0 +1,73 @@
+import asyncio
+import re
+import textwrap
+
+import edge_tts
+
+# Sentence ends (or line breaks) are the preferred split points,
+# clause punctuation is used only when a sentence is too long on its own
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])\s+|\s*\n+\s*')
+CLAUSE_BOUNDARY = re.compile(r'(?<=[,;:])\s+')
+
+
+def _pieces(text, max_chars):
+    """Yield sentences, falling back to clauses and words for long ones"""
+    for sentence in SENTENCE_BOUNDARY.split(text.strip()):
+        if not sentence:
+            continue
+        if len(sentence) <= max_chars:
+            yield sentence
+            continue
+        for clause in CLAUSE_BOUNDARY.split(sentence):
+            if len(clause) <= max_chars:
+                yield clause
+            else:
+                yield from textwrap.wrap(clause, max_chars, break_on_hyphens=False)
+
+
+def iter_chunks(text, max_chars=800):
+    """Yield chunks of at most max_chars split at sentence or clause boundaries"""
+    current = ""
+    for piece in _pieces(text, max_chars):
+        if current and len(current) + 1 + len(piece) > max_chars:
+            yield current
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        yield current
+
+
+def split_text(text, max_chars=800):
+    """Split text into chunks of at most max_chars at sentence or clause boundaries"""
+    return list(iter_chunks(text, max_chars))
+
+
+async def _synthesize_chunk(text, voice, semaphore):
+    """Stream one chunk from edge-tts and return its MP3 frames"""
+    async with semaphore:
+        frames = []
+        async for message in edge_tts.Communicate(text, voice).stream():
+            if message["type"] == "audio":
+                frames.append(message["data"])
+        return b"".join(frames)
+
+
+async def synthesize(text, voice, max_concurrency=4, chunk_chars=800):
+    """Synthesize text chunk by chunk in parallel and return the joined MP3 bytes"""
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = [
+        asyncio.create_task(_synthesize_chunk(chunk, voice, semaphore))
+        for chunk in split_text(text, chunk_chars)
+    ]
+    try:
+        parts = await asyncio.gather(*tasks)
+    finally:
+        # One failed chunk makes the whole result useless
+        for task in tasks:
+            task.cancel()
+
+    audio_data = b"".join(parts)
+    if not audio_data:
+        raise Exception("Audio fayl bo'sh yaratildi!")
+    return audio_data
@@ -0,0 +1,52 @@
+import asyncio
+import functools
+import shutil
+
+# (max text length, bitrate in kbit/s, sample rate in Hz): longer texts
+# get a lower bitrate so voice notes stay small on mobile data
+OPUS_PROFILES = (
+    (1000, 32, 48000),
+    (4000, 24, 24000),
+    (None, 16, 16000),
+)
+OPUS_HIGH_QUALITY = (48, 48000)
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg cannot produce Ogg/Opus output"""
+
+
+@functools.lru_cache(maxsize=None)
+def opus_available():
+    """edge-tts only returns MP3 here, so Opus output needs ffmpeg"""
+    return shutil.which('ffmpeg') is not None
+
+
+def opus_settings(length, quality='auto'):
+    """Return (bitrate kbit/s, sample rate Hz) for a text of the given length"""
+    if quality == 'high':
+        return OPUS_HIGH_QUALITY
+    for max_length, bitrate, sample_rate in OPUS_PROFILES:
+        if max_length is None or length <= max_length:
+            return bitrate, sample_rate
+
+
+async def to_opus(mp3_data, bitrate, sample_rate):
+    """Transcode MP3 bytes to an Ogg/Opus voice note in memory"""
+    process = await asyncio.create_subprocess_exec(
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', 'pipe:0', '-vn', '-ac', '1',
+        '-c:a', 'libopus', '-b:a', f'{bitrate}k', '-ar', str(sample_rate),
+        '-application', 'voip', '-f', 'ogg', 'pipe:1',
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await process.communicate(mp3_data)
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    if process.returncode != 0 or not stdout:
+        raise TranscodeError(stderr.decode(errors='replace').strip() or 'ffmpeg failed')
+    return stdout
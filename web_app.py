@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import os
+
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from telegram import Update
+
+from bot import build_application, start_bot, stop_bot, wait_for_stop_signal
+
+# "webhook" needs a public HTTPS URL, "polling" works anywhere
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+BOT_MODE = os.getenv('BOT_MODE', 'webhook' if WEBHOOK_URL else 'polling')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '8000'))
+
+
+async def health_check(request):
+    return web.Response(text='Bot is running!')
+
+
+async def readiness_check(request):
+    """Report whether the Telegram application is running and receiving updates"""
+    application = request.app['application']
+    receiving = BOT_MODE == 'webhook' or application.updater.running
+    if application.running and receiving:
+        return web.Response(text='ready')
+    return web.Response(status=503, text='not ready')
+
+
+async def metrics_endpoint(request):
+    return web.Response(
+        body=generate_latest(),
+        headers={'Content-Type': CONTENT_TYPE_LATEST}
+    )
+
+
+async def telegram_webhook(request):
+    """Receive an update from Telegram and hand it to the application"""
+    secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token')
+    if WEBHOOK_SECRET and secret != WEBHOOK_SECRET:
+        return web.Response(status=403)
+
+    application = request.app['application']
+    try:
+        update = Update.de_json(await request.json(), application.bot)
+    except ValueError:
+        return web.Response(status=400)
+    await application.update_queue.put(update)
+    return web.Response()
+
+
+def create_app(application):
+    """Create the HTTP app serving the health check and the webhook"""
+    app = web.Application()
+    app['application'] = application
+    app.router.add_get('/', health_check)
+    app.router.add_get('/ready', readiness_check)
+    app.router.add_get('/metrics', metrics_endpoint)
+    if BOT_MODE == 'webhook':
+        app.router.add_post(WEBHOOK_PATH, telegram_webhook)
+    return app
+
+
+async def main():
+    """Run the bot and the HTTP server on one event loop"""
+    logging.basicConfig(
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        level=logging.INFO
+    )
+
+    if BOT_MODE == 'webhook' and not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL not found in environment variables")
+
+    application = build_application()
+    runner = web.AppRunner(create_app(application))
+    await runner.setup()
+
+    try:
+        await web.TCPSite(runner, HOST, PORT).start()
+        logging.info(f"HTTP server listening on {HOST}:{PORT} ({BOT_MODE} mode)")
+
+        webhook_url = None
+        if BOT_MODE == 'webhook':
+            webhook_url = WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+        await start_bot(application, webhook_url=webhook_url, webhook_secret=WEBHOOK_SECRET)
+
+        await wait_for_stop_signal()
+    finally:
+        await stop_bot(application)
+        await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())